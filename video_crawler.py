@@ -11,10 +11,30 @@ from urllib.parse import urlsplit, quote_from_bytes
 import subprocess
 import shutil
 import base64
+import argparse
+import bisect
+import math
+import atexit
+import gzip
+import queue
+import threading
+import hashlib
+import json
+import socket
+import sqlite3
+import tempfile
+import signal
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import namedtuple, deque
 try:
     from Crypto.Cipher import AES
 except Exception:
     AES = None
+try:
+    import psutil
+except Exception:
+    psutil = None
 
 
 DEST_PATH = r'c:\src\inflearn'
@@ -38,6 +58,900 @@ def make_dest_path(dest):
     return dest
 
 
+# 공유 볼륨으로 복사할 때 이 크기 단위로 쓰면서 취소 여부를 확인한다.
+COPY_CHUNK_SIZE = 1024 * 1024
+# 세그먼트 본문을 이 크기 단위로 받으면서 취소 여부를 확인하고 멈춤 제한 시간을 갱신한다.
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# 추정 크기보다 이만큼 여유 공간이 있어야 다운로드를 시작한다.
+DISK_HEADROOM = 1.1
+
+
+def has_free_space(path, needed):
+    try:
+        free = shutil.disk_usage(path).free
+    except OSError:
+        return True
+    return free >= needed * DISK_HEADROOM
+
+
+# 받은 세그먼트를 순서대로 이어 붙이는 출력 파일.
+# 다운로드 중에는 .part 파일에 쓰고, 완료되면 원래 이름으로 바꾼다.
+class SegmentFileWriter:
+    def __init__(self, path, expected_size=0):
+        self.path = path
+        self.part_path = path + ".part"
+        self.expected_size = 0
+        self.segments = 0
+        self._fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+        self._offset = 0
+        self.reserve(expected_size)
+
+    # posix_fallocate가 있을 때만 미리 공간을 잡는다.
+    # Windows의 ftruncate(_chsize_s)는 늘어난 만큼 0을 실제로 기록하므로 쓰기만 두 배가 된다.
+    def reserve(self, size):
+        if size <= self.expected_size:
+            return
+        self.expected_size = size
+        if not hasattr(os, "posix_fallocate"):
+            return
+        try:
+            os.posix_fallocate(self._fd, 0, size)
+        except OSError as e:
+            print(f"  [WRITE] preallocate failed: {e}")
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            n = os.write(self._fd, view)
+            view = view[n:]
+        self._offset += len(data)
+        self.segments += 1
+
+    # 미리 잡아둔 나머지 공간을 잘라내고 원래 이름으로 바꾼다.
+    def finish(self):
+        os.ftruncate(self._fd, self._offset)
+        os.close(self._fd)
+        self._fd = None
+        os.replace(self.part_path, self.path)
+        return self._offset
+
+    def abort(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        try:
+            os.remove(self.part_path)
+        except OSError:
+            pass
+
+
+def unit_id_from_url(url):
+    m = re.search(r"[?&]unitId=([^&#]+)", url or "")
+    return m.group(1) if m else None
+
+
+def env_int(name, default=0):
+    val = os.getenv(name, "").strip()
+    return int(val) if val.isdigit() else default
+
+
+# byterange는 (offset, length), init은 EXT-X-MAP으로 지정된 초기화 구간인지 여부.
+# sequence는 EXT-X-MEDIA-SEQUENCE 기준 번호로, IV가 없을 때 IV로 쓴다.
+# duration은 #EXTINF 값(초).
+Segment = namedtuple("Segment", ["uri", "key_uri", "iv", "sequence", "byterange", "init", "duration"],
+                     defaults=(0, None, False, 0.0))
+# 세그먼트 요청 결과(Range 요청이면 그중 한 조각). requests 응답과 같은 속성을 가진다.
+# Range 요청 하나로 받은 세그먼트 조각. requests 응답과 같은 속성을 가진다.
+RangePart = namedtuple("RangePart", ["status_code", "content", "text"])
+
+# 강의 페이지에서 얻은 정보와 출력 파일 이름.
+UnitPage = namedtuple("UnitPage", ["unit_id", "lecture_title", "course_title", "raw_filename", "course_filename",
+                                   "clip_start", "clip_end"])
+
+# 선택한 재생목록과 받을 세그먼트 목록. bandwidth/duration은 크기 추정에 쓴다.
+# clip_window는 --from/--to로 잘라낸 실제 (시작, 끝) 초이고, 자르지 않았으면 None이다.
+UnitStream = namedtuple("UnitStream", ["session", "headers", "root_url", "signed_query", "items", "total_segments",
+                                       "bandwidth", "duration", "subtitle_uris", "clip_window"])
+
+
+def _playlist_uri(line):
+    if line.startswith(b"http"):
+        return line.decode("utf-8", "ignore")
+    decoded = line.decode("utf-8", "ignore")
+    if decoded and decoded.isascii():
+        return decoded
+    return quote_from_bytes(line)
+
+
+def parse_media_playlist(content):
+    current_key_uri = None
+    current_iv = None
+    sequence = 0
+    pending_range = None
+    pending_duration = 0.0
+    next_offset = {}
+    current_map = None
+    written_map = None
+    segments = []
+    for line in content.splitlines():
+        if not line:
+            continue
+        if line.startswith(b"#EXT-X-MEDIA-SEQUENCE:"):
+            try:
+                sequence = int(line.split(b":", 1)[1].strip())
+            except ValueError:
+                pass
+            continue
+        if line.startswith(b"#EXT-X-KEY:"):
+            text = line.decode("utf-8", "ignore")
+            m = re.search(r'URI="([^"]+)"', text)
+            current_key_uri = m.group(1) if m else None
+            m = re.search(r'IV=0x([0-9a-fA-F]+)', text)
+            current_iv = bytes.fromhex(m.group(1)) if m else None
+            continue
+        if line.startswith(b"#EXT-X-MAP:"):
+            text = line.decode("utf-8", "ignore")
+            m = re.search(r'URI="([^"]+)"', text)
+            r = re.search(r'BYTERANGE="(\d+)(?:@(\d+))?"', text)
+            map_range = (int(r.group(2) or 0), int(r.group(1))) if r else None
+            current_map = (m.group(1), map_range) if m else None
+            continue
+        if line.startswith(b"#EXTINF:"):
+            m = re.match(rb"#EXTINF:([0-9.]+)", line)
+            pending_duration = float(m.group(1)) if m else 0.0
+            continue
+        if line.startswith(b"#EXT-X-BYTERANGE:"):
+            m = re.match(rb"#EXT-X-BYTERANGE:(\d+)(?:@(\d+))?", line)
+            if m:
+                pending_range = (int(m.group(1)), int(m.group(2)) if m.group(2) is not None else None)
+            continue
+        if line.startswith(b"#"):
+            continue
+        seg = _playlist_uri(line)
+        if current_map and current_map != written_map:
+            segments.append(Segment(current_map[0], current_key_uri, current_iv, sequence, current_map[1], True))
+            written_map = current_map
+        byterange = None
+        if pending_range:
+            length, offset = pending_range
+            # offset이 없으면 같은 리소스의 이전 구간 바로 뒤부터 시작한다.
+            if offset is None:
+                offset = next_offset.get(seg, 0)
+            byterange = (offset, length)
+            next_offset[seg] = offset + length
+            pending_range = None
+        segments.append(Segment(seg, current_key_uri, current_iv, sequence, byterange, False, pending_duration))
+        pending_duration = 0.0
+        sequence += 1
+    return segments
+
+
+# "12:30", "1:02:03.5", "90" 같은 시각을 초로 바꾼다.
+# 첫 칸을 뺀 분/초 칸은 60 미만이어야 하고, nan/inf 같은 값은 받지 않는다.
+def parse_timestamp(text):
+    total = 0.0
+    try:
+        parts = text.strip().split(":")
+        if len(parts) > 3:
+            raise ValueError
+        for pos, part in enumerate(parts):
+            value = float(part)
+            if not math.isfinite(value) or value < 0 or (pos > 0 and value >= 60):
+                raise ValueError
+            total = total * 60 + value
+    except ValueError:
+        raise ValueError(f"invalid timestamp: {text!r} (use e.g. 90, 12:30, 1:02:03)") from None
+    return total
+
+
+# INFLEARN_FROM/INFLEARN_TO를 (시작, 끝) 초로 읽는다. 형식이 틀리거나 시작이 끝보다 늦으면 ValueError.
+def clip_range_from_env():
+    clip_from = os.getenv("INFLEARN_FROM", "").strip()
+    clip_to = os.getenv("INFLEARN_TO", "").strip()
+    start = parse_timestamp(clip_from) if clip_from else None
+    end = parse_timestamp(clip_to) if clip_to else None
+    if start is not None and end is not None and start >= end:
+        raise ValueError(f"INFLEARN_FROM ({clip_from}) must be earlier than INFLEARN_TO ({clip_to})")
+    return start, end
+
+
+def format_clip_label(start, end):
+    def fmt(sec):
+        sec = int(sec)
+        return f"{sec // 60}m{sec % 60:02d}s" if sec < 3600 else f"{sec // 3600}h{sec // 60 % 60:02d}m{sec % 60:02d}s"
+    return f"{fmt(start or 0)}-{fmt(end) if end is not None else 'end'}"
+
+
+# #EXTINF 누적 합(prefix sum)에서 이진 탐색으로 [start, end) 구간을 덮는 세그먼트만 남긴다.
+# 잘라낸 구간 앞의 초기화 구간(EXT-X-MAP)은 유지한다. 반환값은 (세그먼트 목록, 실제 시작 시각).
+# 구간이 재생목록 밖이거나 끝이 시작보다 앞이면 빈 목록을 돌려준다.
+def clip_segments(segments, start=None, end=None):
+    media_idx = [i for i, seg in enumerate(segments) if not seg.init]
+    if not media_idx:
+        return segments, 0.0
+    starts = [0.0]
+    for i in media_idx:
+        starts.append(starts[-1] + segments[i].duration)
+    if (start is not None and start >= starts[-1]) or \
+       (start is not None and end is not None and end <= start) or \
+       (end is not None and end <= 0):
+        return [], start or 0.0
+    first = 0
+    last = len(media_idx) - 1
+    if start is not None:
+        first = min(max(bisect.bisect_right(starts, start) - 1, 0), last)
+    if end is not None:
+        last = min(max(bisect.bisect_left(starts, end) - 1, first), last)
+    clipped = []
+    init = None
+    for i, seg in enumerate(segments):
+        if seg.init:
+            init = seg
+            continue
+        if i < media_idx[first]:
+            continue
+        if i > media_idx[last]:
+            break
+        if init is not None:
+            clipped.append(init)
+            init = None
+        clipped.append(seg)
+    return clipped, starts[first]
+
+
+# 같은 리소스에서 이어지는 byte range를 max_bytes까지 하나의 요청으로 묶는다.
+# 반환값은 items 인덱스 목록의 목록이다.
+def coalesce_ranges(items, max_bytes):
+    groups = []
+    current = []
+    for idx, seg in enumerate(items):
+        if current:
+            prev = items[current[-1]]
+            start = items[current[0]].byterange[0] if items[current[0]].byterange else 0
+            if seg.byterange and prev.byterange and seg.uri == prev.uri and \
+               prev.byterange[0] + prev.byterange[1] == seg.byterange[0] and \
+               seg.byterange[0] + seg.byterange[1] - start <= max_bytes:
+                current.append(idx)
+                continue
+            groups.append(current)
+        current = [idx]
+    if current:
+        groups.append(current)
+    return groups
+
+
+# EXT-X-MEDIA 없이 파일명(ko.m3u8 등)만으로 자막이라고 볼 언어들.
+SUBTITLE_LANGS = ("ko", "en", "vi")
+
+
+# master 재생목록에서 자막 rendition을 {언어: URI}로 뽑는다.
+# EXT-X-MEDIA가 없으면 STREAM-INF 뒤의 ko.m3u8 같은 파일명에서 언어를 얻는다. (SUBTITLE_LANGS만)
+def parse_subtitle_renditions(content):
+    renditions = {}
+    last_was_stream = False
+    for line in content.splitlines():
+        text = line.decode("utf-8", "ignore").strip()
+        if text.startswith("#EXT-X-MEDIA:") and "TYPE=SUBTITLES" in text:
+            lang = re.search(r'LANGUAGE="([^"]+)"', text)
+            uri = re.search(r'URI="([^"]+)"', text)
+            if uri:
+                renditions.setdefault((lang.group(1) if lang else "und").lower(), uri.group(1))
+            continue
+        if text.startswith("#EXT-X-STREAM-INF"):
+            last_was_stream = True
+            continue
+        if text.startswith("#") or not text:
+            continue
+        m = re.search(r"(?:^|/)([a-z]{2})\.m3u8", text)
+        if last_was_stream and m and m.group(1) in SUBTITLE_LANGS:
+            renditions.setdefault(m.group(1), text)
+        last_was_stream = False
+    return renditions
+
+
+def _vtt_seconds(stamp):
+    parts = stamp.replace(",", ".").split(":")
+    total = 0.0
+    for part in parts:
+        total = total * 60 + float(part)
+    return total
+
+
+def _vtt_stamp(seconds):
+    ms = int(round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+
+def _srt_stamp(seconds):
+    ms = int(round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+
+# WebVTT 조각들을 하나로 합친다. 세그먼트 경계에서 반복되는 cue는 한 번만 남긴다.
+def merge_webvtt(bodies):
+    cues = []
+    seen = set()
+    for body in bodies:
+        text = body.decode("utf-8-sig", "ignore").replace("\r\n", "\n")
+        for block in re.split(r"\n\s*\n", text):
+            lines = [line for line in block.strip().split("\n") if line]
+            timing_idx = next((i for i, line in enumerate(lines) if "-->" in line), None)
+            if timing_idx is None:
+                continue
+            timing = lines[timing_idx].strip()
+            payload = "\n".join(lines[timing_idx + 1:])
+            if (timing, payload) in seen:
+                continue
+            seen.add((timing, payload))
+            start, _, rest = timing.partition("-->")
+            end = rest.split()[0] if rest.split() else start
+            cues.append((_vtt_seconds(start.strip()), _vtt_seconds(end), timing, payload))
+    cues.sort(key=lambda cue: cue[0])
+    return cues
+
+
+# 잘라낸 영상에 맞춰 [start, end) 구간과 겹치는 cue만 남기고 시각을 start만큼 앞당긴다.
+def clip_cues(cues, start, end):
+    clipped = []
+    for cue_start, cue_end, timing, payload in cues:
+        if cue_end <= start or cue_start >= end:
+            continue
+        new_start = max(cue_start, start) - start
+        new_end = min(cue_end, end) - start
+        settings = timing.partition("-->")[2].split()[1:]
+        timing = " ".join([f"{_vtt_stamp(new_start)} --> {_vtt_stamp(new_end)}"] + settings)
+        clipped.append((new_start, new_end, timing, payload))
+    return clipped
+
+
+def format_subtitles(cues, fmt="vtt"):
+    if fmt == "srt":
+        return "\n".join(
+            f"{num}\n{_srt_stamp(start)} --> {_srt_stamp(end)}\n{payload}\n"
+            for num, (start, end, _, payload) in enumerate(cues, 1)
+        )
+    return "WEBVTT\n\n" + "\n".join(f"{timing}\n{payload}\n" for _, _, timing, payload in cues)
+
+
+PlaylistResponse = namedtuple("PlaylistResponse", ["status_code", "content", "segments", "from_cache"])
+
+
+# 재생목록 본문과 ETag/Last-Modified, 파싱한 세그먼트 목록을 unit/변형별로 저장한다.
+# 서명된 쿼리 문자열은 매번 바뀌므로 캐시 키에서 제외하고 URL 경로만 쓴다.
+class PlaylistCache:
+    def __init__(self, root=os.path.join("cache", "playlists"), enabled=True):
+        self.root = root
+        self.enabled = enabled
+
+    def _entry_path(self, unit_id, url):
+        path = urlsplit(url).path
+        digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+        name = trim_path(os.path.basename(path)) or "playlist"
+        return os.path.join(self.root, trim_path(unit_id or "default"), f"{digest}_{name}.json")
+
+    def _load(self, entry_path):
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            entry["body"] = base64.b64decode(entry["body"])
+            if entry.get("segments") is not None:
+                entry["segments"] = [
+                    Segment(uri, key_uri, bytes.fromhex(iv) if iv else None, sequence,
+                            tuple(byterange) if byterange else None, init, duration)
+                    for uri, key_uri, iv, sequence, byterange, init, duration in entry["segments"]
+                ]
+            return entry
+        except Exception:
+            return None
+
+    def _store(self, entry_path, body, etag, last_modified, segments):
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            entry = {
+                "body": base64.b64encode(body).decode("ascii"),
+                "etag": etag,
+                "last_modified": last_modified,
+                "segments": None if segments is None else [
+                    [seg.uri, seg.key_uri, seg.iv.hex() if seg.iv else None, seg.sequence,
+                     list(seg.byterange) if seg.byterange else None, seg.init, seg.duration]
+                    for seg in segments
+                ],
+            }
+            tmp_path = entry_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, entry_path)
+        except Exception as e:
+            print("  [CACHE] store failed:", e)
+
+    def fetch(self, session, url, headers, unit_id, timeout=None):
+        entry_path = self._entry_path(unit_id, url)
+        entry = self._load(entry_path) if self.enabled else None
+        # 브라우저에서 복사한 조건부 헤더는 버리고 캐시에 있는 값만 보낸다. (None이면 세션 헤더도 제거됨)
+        req_headers = {
+            k: v for k, v in headers.items()
+            if k.lower() not in ("if-none-match", "if-modified-since")
+        }
+        req_headers["If-None-Match"] = entry.get("etag") if entry else None
+        req_headers["If-Modified-Since"] = entry.get("last_modified") if entry else None
+        resp = session.get(url=url, headers=req_headers, timeout=timeout)
+        if resp.status_code == 304 and entry:
+            return PlaylistResponse(200, entry["body"], entry["segments"], True)
+        if resp.status_code != 200:
+            return PlaylistResponse(resp.status_code, resp.content, None, False)
+        content = resp.content
+        segments = parse_media_playlist(content) if b"#EXTINF" in content else None
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if self.enabled and (etag or last_modified):
+            self._store(entry_path, content, etag, last_modified, segments)
+        return PlaylistResponse(200, content, segments, False)
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f}{unit}" if unit != "B" else f"{int(size)}B"
+        size /= 1024.0
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+# 디버그 파일을 백그라운드 스레드에서 기록한다.
+# 강의(unit)별 하위 폴더에 저장하고, 용량이 max_bytes를 넘으면 오래된 폴더부터 지운다.
+# 재생목록은 실패했거나 sample_every 개 중 하나로 뽑힌 강의에서만 남긴다.
+class DebugStore:
+    def __init__(self, root="debug", sample_every=0, max_bytes=200 * 1024 * 1024, compress=True):
+        self.root = root
+        self.sample_every = sample_every
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self._queue = queue.Queue(maxsize=64)
+        self._unit_dir = "session"
+        self._sampled = False
+        self._pending = []
+        self._units = 0
+        self._seq = 0
+        self._dropped = 0
+        self._total = self._dir_size(root)
+        self._thread = threading.Thread(target=self._run, name="debug-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _dir_size(self, path):
+        total = 0
+        for dirpath, _, filenames in os.walk(path):
+            for name in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, name))
+                except OSError:
+                    pass
+        return total
+
+    def begin_unit(self, unit_id):
+        self._units += 1
+        self._unit_dir = trim_path(unit_id or f"unit_{self._units}")
+        self._sampled = self.sample_every > 0 and self._units % self.sample_every == 0
+        self._pending = []
+
+    def end_unit(self, ok):
+        if not ok:
+            for name, data in self._pending:
+                self.save(name, data)
+        self._pending = []
+        self._unit_dir = "session"
+
+    def add_playlist(self, name, data):
+        if self._sampled:
+            return self.save(name, data)
+        self._pending.append((name, data))
+        return None
+
+    def save(self, name, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._seq += 1
+        filename = f"{time.strftime('%H%M%S')}_{self._seq:04d}_{name}"
+        if self.compress and not name.endswith(".png"):
+            filename += ".gz"
+        path = os.path.join(self.root, self._unit_dir, filename)
+        try:
+            self._queue.put_nowait((path, data))
+        except queue.Full:
+            self._dropped += 1
+            if self._dropped == 1:
+                print("[DEBUG] writer queue full, dropping debug files")
+            return None
+        return path
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            path, data = item
+            try:
+                if path.endswith(".gz"):
+                    data = gzip.compress(data)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(data)
+                self._total += len(data)
+                if self._total > self.max_bytes:
+                    self._rotate(os.path.dirname(path))
+            except Exception as e:
+                print("[DEBUG] write failed:", e)
+
+    def _rotate(self, keep_dir):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.abspath(path) == os.path.abspath(keep_dir):
+                continue
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        for _, path in sorted(entries):
+            if self._total <= self.max_bytes:
+                break
+            size = self._dir_size(path) if os.path.isdir(path) else os.path.getsize(path)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                self._total -= size
+            except OSError:
+                pass
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+
+
+# 여러 머신이 나눠서 받을 강의(unit) 목록. 공유 볼륨의 SQLite 파일을 쓴다.
+# 작업자는 unit을 lease로 가져가고 heartbeat로 연장하며, 만료된 lease는 다른 작업자가 다시 가져간다.
+class WorkLedger:
+    def __init__(self, path, lease_seconds=600, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS units ("
+                " unit_url TEXT PRIMARY KEY,"
+                " idx INTEGER NOT NULL,"
+                " state TEXT NOT NULL DEFAULT 'pending',"
+                " worker TEXT,"
+                " lease_until REAL NOT NULL DEFAULT 0,"
+                " heartbeat REAL NOT NULL DEFAULT 0,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " updated REAL NOT NULL DEFAULT 0)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # 스레드마다 따로 쓰도록 매번 새 연결을 연다.
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            # BEGIN 자체가 실패한 경우(database is locked 등)에는 원래 에러를 그대로 올린다.
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def add_units(self, units):
+        now = time.time()
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO units (unit_url, idx, updated) VALUES (?, ?, ?)",
+                [(unit_url, idx, now) for idx, unit_url in units],
+            )
+            return conn.total_changes - before
+
+    def claim(self, worker):
+        now = time.time()
+        with self._connect() as conn:
+            # 작업자를 죽이거나 멈추게 한 unit은 complete까지 가지 못하므로 여기서 시도 횟수를 본다.
+            cur = conn.execute(
+                "UPDATE units SET state = 'failed', lease_until = 0, updated = ?"
+                " WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            if cur.rowcount:
+                print(f"[LEDGER] {cur.rowcount} expired lease(s) reached max attempts, marked failed")
+            row = conn.execute(
+                "SELECT unit_url, idx, state FROM units"
+                " WHERE state = 'pending' OR (state = 'leased' AND lease_until < ? AND attempts < ?)"
+                " ORDER BY idx LIMIT 1",
+                (now, self.max_attempts),
+            ).fetchone()
+            if row is None:
+                return None
+            unit_url, idx, state = row
+            if state == "leased":
+                print(f"[LEDGER] reclaiming expired lease: {idx}")
+            conn.execute(
+                "UPDATE units SET state = 'leased', worker = ?, lease_until = ?, heartbeat = ?,"
+                " attempts = attempts + 1, updated = ? WHERE unit_url = ?",
+                (worker, now + self.lease_seconds, now, now, unit_url),
+            )
+            return idx, unit_url
+
+    def heartbeat(self, unit_url, worker):
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE units SET lease_until = ?, heartbeat = ?, updated = ?"
+                " WHERE unit_url = ? AND worker = ? AND state = 'leased'",
+                (now + self.lease_seconds, now, now, unit_url, worker),
+            )
+            return cur.rowcount == 1
+
+    def complete(self, unit_url, worker, ok):
+        now = time.time()
+        with self._connect() as conn:
+            if ok:
+                state = "done"
+            else:
+                row = conn.execute("SELECT attempts FROM units WHERE unit_url = ?", (unit_url,)).fetchone()
+                state = "failed" if row and row[0] >= self.max_attempts else "pending"
+            cur = conn.execute(
+                "UPDATE units SET state = ?, lease_until = 0, updated = ?"
+                " WHERE unit_url = ? AND worker = ? AND state = 'leased'",
+                (state, now, unit_url, worker),
+            )
+            # lease가 만료되어 다른 작업자가 가져간 경우에는 결과를 기록하지 않는다.
+            return state if cur.rowcount == 1 else "lost"
+
+    def counts(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT state, COUNT(*) FROM units GROUP BY state").fetchall())
+
+    # 작업하는 동안 별도 스레드에서 lease를 계속 연장한다.
+    @contextmanager
+    def keep_alive(self, unit_url, worker):
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    if not self.heartbeat(unit_url, worker):
+                        print("\n[LEDGER] lease lost:", unit_url)
+                        return
+                except Exception as e:
+                    print("\n[LEDGER] heartbeat failed:", e)
+
+        thread = threading.Thread(target=beat, name="ledger-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+
+# pid와 그 하위 프로세스(chromedriver -> chrome -> renderer ...)를 모두 강제 종료한다.
+# psutil이 없으면 Windows는 taskkill, 그 외에는 pgrep으로 하위 프로세스를 찾는다.
+def kill_process_tree(pid):
+    if not pid:
+        return
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            procs = root.children(recursive=True) + [root]
+        except psutil.Error:
+            return
+        for proc in procs:
+            try:
+                proc.kill()
+            except psutil.Error:
+                pass
+        psutil.wait_procs(procs, timeout=5)
+        return
+    if os.name == "nt":
+        try:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], capture_output=True, timeout=30)
+        except Exception as e:
+            print("[WATCHDOG] taskkill failed:", e)
+        return
+    # 부모를 먼저 죽이면 자식이 init으로 넘어가 찾을 수 없으므로, 트리를 다 모은 뒤 종료한다.
+    pids = [pid]
+    i = 0
+    while i < len(pids):
+        try:
+            out = subprocess.run(["pgrep", "-P", str(pids[i])], capture_output=True, text=True, timeout=10).stdout
+            pids.extend(int(child) for child in out.split())
+        except Exception:
+            pass
+        i += 1
+    for target in reversed(pids):
+        try:
+            os.kill(target, signal.SIGKILL)
+        except Exception:
+            pass
+
+
+# unit이나 단계(stage)의 제한 시간이 지났을 때 발생한다.
+# 곳곳의 "except Exception"에 삼켜지지 않도록 BaseException을 상속한다. (asyncio.CancelledError와 같은 방식)
+class UnitTimeout(BaseException):
+    pass
+
+
+# 제한 시간과 취소 플래그. 하위 단계는 부모보다 늦게 끝날 수 없고 취소 플래그를 공유한다.
+# seconds가 None이면 시간 제한 없이 취소 플래그만 가진다.
+class Deadline:
+    def __init__(self, seconds, stage="unit", cancelled=None, parent=None):
+        self.stage = stage
+        self.seconds = seconds
+        self.parent = parent
+        self.cancelled = cancelled or threading.Event()
+        self.touch()
+
+    # 진행이 있을 때 호출하면 제한 시간을 지금부터 다시 센다. (멈춤 감시용)
+    def touch(self):
+        if self.seconds is None:
+            self.expires = float("inf")
+        else:
+            self.expires = time.monotonic() + self.seconds
+        if self.parent is not None:
+            self.expires = min(self.expires, self.parent.expires)
+
+    def child(self, stage, seconds):
+        return Deadline(seconds, stage, self.cancelled, self)
+
+    def remaining(self):
+        return self.expires - time.monotonic()
+
+    def check(self):
+        if self.cancelled.is_set() or self.remaining() <= 0:
+            self.cancelled.set()
+            raise UnitTimeout(f"{self.stage} deadline exceeded")
+
+    # 남은 시간 안에서 요청 하나에 쓸 timeout을 돌려준다.
+    def timeout(self, cap):
+        self.check()
+        return max(1.0, min(cap, self.remaining()))
+
+
+# 현재 제한 시간을 감시하는 스레드. 시간이 지나면 취소 플래그를 세우고,
+# grace 초가 더 지나도 끝나지 않으면(WebDriver 호출 등에 묶인 경우) on_stall을 한 번 호출한다.
+class Watchdog:
+    def __init__(self, on_stall, grace=30):
+        self._on_stall = on_stall
+        self._grace = grace
+        self._deadline = None
+        self._stalled = None
+        self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+        self._thread.start()
+
+    def watch(self, deadline):
+        self._deadline = deadline
+
+    def _run(self):
+        while True:
+            time.sleep(1)
+            deadline = self._deadline
+            if deadline is None or deadline.remaining() > 0:
+                continue
+            deadline.cancelled.set()
+            if deadline.remaining() <= -self._grace and self._stalled is not deadline:
+                self._stalled = deadline
+                try:
+                    self._on_stall(deadline.stage)
+                except Exception as e:
+                    print("[WATCHDOG] stall handler failed:", e)
+
+
+# execute_async_script로 실행하는 대기 스크립트들.
+# arguments[0]은 제한 시간(ms)이고, 마지막 인자는 WebDriver가 넘겨주는 callback이다.
+
+# video 태그가 생기고 플레이어가 재생 준비(loadedmetadata/playing, vjs-playing, src)되면 바로 반환한다.
+PLAYER_READY_JS = """
+    const timeoutMs = arguments[0];
+    const kickMs = arguments[1];
+    const callback = arguments[arguments.length - 1];
+    let finished = false;
+    let observer = null;
+    const timers = [];
+    const done = (state) => {
+        if (finished) return;
+        finished = true;
+        if (observer) observer.disconnect();
+        timers.forEach(clearTimeout);
+        callback(state);
+    };
+    const check = () => {
+        const v = document.querySelector('video');
+        if (!v) return;
+        const vjs = document.querySelector('.video-js');
+        if ((vjs && vjs.classList.contains('vjs-playing')) || v.getAttribute('src') || v.readyState >= 1) {
+            done('ready');
+            return;
+        }
+        if (!v.__inflearnReady) {
+            v.__inflearnReady = true;
+            v.addEventListener('loadedmetadata', () => done('loadedmetadata'), {once: true});
+            v.addEventListener('playing', () => done('playing'), {once: true});
+        }
+    };
+    observer = new MutationObserver(check);
+    observer.observe(document.documentElement, {
+        childList: true, subtree: true, attributes: true, attributeFilter: ['class', 'src']
+    });
+    // 재생이 시작되지 않으면 일시정지 버튼을 한 번 눌러 준다.
+    timers.push(setTimeout(() => {
+        const btn = document.querySelector('button.vjs-paused, .vjs-paused .vjs-play-control');
+        if (btn) btn.click();
+    }, kickMs));
+    timers.push(setTimeout(() => done(document.querySelector('video') ? 'timeout' : 'no_video'), timeoutMs));
+    check();
+"""
+
+# 음소거로 재생을 시작하고 실제로 재생(playing)될 때까지 기다린다.
+VIDEO_PLAYING_JS = """
+    const timeoutMs = arguments[0];
+    const callback = arguments[arguments.length - 1];
+    const v = document.querySelector('video');
+    if (!v) { callback('no_video'); return; }
+    v.muted = true;
+    if (!v.paused && v.readyState >= 3) { callback('playing'); return; }
+    let finished = false;
+    const done = (state) => {
+        if (finished) return;
+        finished = true;
+        clearTimeout(timer);
+        callback(state);
+    };
+    const timer = setTimeout(() => done('timeout'), timeoutMs);
+    v.addEventListener('playing', () => done('playing'), {once: true});
+    const p = v.play();
+    if (p && p.catch) p.catch(() => done('blocked'));
+"""
+
+# 셀렉터 중 하나라도 화면에 보이면 반환한다.
+SELECTOR_READY_JS = """
+    const timeoutMs = arguments[0];
+    const selectors = arguments[1];
+    const callback = arguments[arguments.length - 1];
+    let finished = false;
+    let observer = null;
+    let timer = null;
+    const done = (found) => {
+        if (finished) return;
+        finished = true;
+        if (observer) observer.disconnect();
+        clearTimeout(timer);
+        callback(found);
+    };
+    const check = () => {
+        for (const css of selectors) {
+            for (const el of document.querySelectorAll(css)) {
+                if (el.getClientRects().length) { done(css); return; }
+            }
+        }
+    };
+    observer = new MutationObserver(check);
+    observer.observe(document.documentElement, {
+        childList: true, subtree: true, attributes: true, attributeFilter: ['class', 'style', 'hidden']
+    });
+    timer = setTimeout(() => done(null), timeoutMs);
+    check();
+"""
+
+
 def load_env_file(path=".env"):
     env_path = os.path.abspath(path)
     loaded = set()
@@ -59,9 +973,157 @@ def load_env_file(path=".env"):
 
 class VideoCrawler:
     def __init__(self):
-        self._driver = webdriver.Chrome()
+        # 아래 설정들도 .env 값을 쓰도록 먼저 읽어 둔다.
+        self._env_loaded = load_env_file()
+        # 브라우저를 띄우기 전에 잘못된 구간 설정을 걸러낸다.
+        self._clip_range = clip_range_from_env()
+        self._driver = self._new_driver()
         self._wait = WebDriverWait(self._driver, 20)
-        make_dest_path(DEST_PATH)
+        self._deadline = None
+        self._request_timeout = env_int("INFLEARN_REQUEST_TIMEOUT", 30)
+        self._watchdog = Watchdog(self._kill_browser, grace=env_int("INFLEARN_STALL_GRACE", 30))
+        self._debug = DebugStore(
+            sample_every=env_int("INFLEARN_DEBUG_SAMPLE", 0),
+            max_bytes=env_int("INFLEARN_DEBUG_MAX_MB", 200) * 1024 * 1024,
+            compress=os.getenv("INFLEARN_DEBUG_COMPRESS", "1").strip() != "0",
+        )
+        self._playlists = PlaylistCache(
+            root=os.getenv("INFLEARN_CACHE_PATH", "").strip() or os.path.join("cache", "playlists"),
+            enabled=os.getenv("INFLEARN_CACHE", "1").strip() != "0",
+        )
+        self._scratch_path = None
+        make_dest_path(self._dest_root())
+
+    def _new_driver(self):
+        driver = webdriver.Chrome()
+        driver.set_page_load_timeout(env_int("INFLEARN_PAGE_TIMEOUT", 120))
+        return driver
+
+    def _browser_pid(self, driver):
+        try:
+            return driver.service.process.pid
+        except Exception:
+            return None
+
+    # watchdog 스레드에서 호출된다. 멈춘 WebDriver 호출이 에러로 빠져나오도록
+    # chromedriver와 그 아래의 Chrome 프로세스들을 함께 종료한다.
+    def _kill_browser(self, stage):
+        print(f"\n[WATCHDOG] {stage} stalled, killing browser")
+        try:
+            kill_process_tree(self._browser_pid(self._driver))
+        except Exception as e:
+            print("[WATCHDOG] kill failed:", e)
+
+    def _browser_responsive(self, timeout=10):
+        result = {}
+
+        def ping():
+            try:
+                result["ok"] = self._driver.execute_script("return 1") == 1
+            except Exception:
+                result["ok"] = False
+
+        thread = threading.Thread(target=ping, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        return result.get("ok", False)
+
+    # 브라우저를 정리하고 새로 띄워 다시 로그인한다. 실패하면 간격을 늘려가며 재시도하고,
+    # 끝내 실패해도 예외를 올리지 않고 False를 돌려준다. (다음 unit에서 다시 시도한다.)
+    def _restart_browser(self):
+        old = self._driver
+        pid = self._browser_pid(old)
+
+        def quit_old():
+            try:
+                old.quit()
+            except Exception as e:
+                print("[WATCHDOG] quit failed:", self._safe_ascii(str(e))[:200])
+
+        closer = threading.Thread(target=quit_old, daemon=True)
+        closer.start()
+        closer.join(15)
+        # quit이 실패하거나 멈춰도 Chrome이 남지 않도록 프로세스 트리를 정리한다.
+        kill_process_tree(pid)
+
+        attempts = max(1, env_int("INFLEARN_RESTART_ATTEMPTS", 5))
+        delay = 10
+        for attempt in range(1, attempts + 1):
+            print(f"[WATCHDOG] restarting browser... ({attempt}/{attempts})")
+            try:
+                self._driver = self._new_driver()
+                self._wait = WebDriverWait(self._driver, 20)
+                self.login()
+                return True
+            except Exception as e:
+                print("[WATCHDOG] restart failed:", self._safe_ascii(str(e))[:200])
+                if self._driver is not old:
+                    kill_process_tree(self._browser_pid(self._driver))
+            if attempt < attempts:
+                time.sleep(delay)
+                delay = min(delay * 2, 300)
+        return False
+
+    def _check_deadline(self):
+        if self._deadline is not None:
+            self._deadline.check()
+
+    def _touch_deadline(self):
+        if self._deadline is not None:
+            self._deadline.touch()
+
+    def _http_timeout(self):
+        if self._deadline is None:
+            return self._request_timeout
+        return self._deadline.timeout(self._request_timeout)
+
+    # 하위 프로세스 실행이나 결과 대기처럼 한 번에 끝나는 작업에 쓸 timeout. 남은 unit 시간을 넘지 않는다.
+    def _step_timeout(self, cap):
+        if self._deadline is None:
+            return cap
+        return self._deadline.timeout(cap)
+
+    # unit 전체의 제한 시간을 걸고 watchdog이 감시하게 한다.
+    # 긴 강의도 끝나도록 넉넉하게 잡고, 실제 진행은 각 단계(_stage)의 제한 시간이 감시한다.
+    @contextmanager
+    def _unit_budget(self):
+        self._deadline = Deadline(env_int("INFLEARN_UNIT_TIMEOUT", 6 * 3600), "unit")
+        self._watchdog.watch(self._deadline)
+        try:
+            yield self._deadline
+        finally:
+            self._watchdog.watch(None)
+            self._deadline = None
+
+    # unit 안의 한 단계에 제한 시간을 건다. 단계 시간이 지나면 unit 전체가 취소된다.
+    # 다운로드 단계는 _touch_deadline으로 진행이 있을 때마다 시간을 다시 센다.
+    @contextmanager
+    def _stage(self, name, seconds):
+        parent = self._deadline
+        if parent is None:
+            yield
+            return
+        self._deadline = parent.child(name, seconds)
+        self._watchdog.watch(self._deadline)
+        try:
+            yield
+        finally:
+            self._deadline = parent
+            self._watchdog.watch(parent)
+
+    # 한 unit을 받는다. 시간 초과나 브라우저 오류면 브라우저를 점검(필요하면 재시작)하고 재시도 대상으로 알린다.
+    # work를 주면 get_video_from_url 대신 실행한다. (계획 모드 등)
+    # 반환값은 (work 결과, 재시도 여부).
+    def _run_unit(self, unit_url, work=None):
+        try:
+            return (work or self.get_video_from_url)(unit_url), False
+        except UnitTimeout as e:
+            print(f"\n[WATCHDOG] {e}: {unit_url}")
+        except Exception as e:
+            print(f"\n[WATCHDOG] unit error: {self._safe_ascii(str(e))[:200]}")
+        if not self._browser_responsive() and not self._restart_browser():
+            print("[WATCHDOG] browser is not available, continuing with the next unit")
+        return False, True
 
     def _safe_ascii(self, text):
         try:
@@ -70,19 +1132,15 @@ class VideoCrawler:
             return text
 
     def _dump_debug(self, prefix="login_fail"):
-        os.makedirs("debug", exist_ok=True)
-        ts = time.strftime("%Y%m%d_%H%M%S")
-        png = f"debug/{prefix}_{ts}.png"
-        html = f"debug/{prefix}_{ts}.html"
-
+        png = None
+        html = None
         try:
-            self._driver.save_screenshot(png)
+            png = self._debug.save(f"{prefix}.png", self._driver.get_screenshot_as_png())
         except Exception:
             pass
 
         try:
-            with open(html, "w", encoding="utf-8") as f:
-                f.write(self._driver.page_source)
+            html = self._debug.save(f"{prefix}.html", self._driver.page_source)
         except Exception:
             pass
 
@@ -105,9 +1163,32 @@ class VideoCrawler:
             time.sleep(0.2)
         raise TimeoutException(f"None of selectors found: {css_list}") from last_err
     
+    # 대기 스크립트를 실행한다. 페이지 쪽 스크립트 오류나 대기 시간 초과면 None을 돌려주고,
+    # 단계 시간이 지났거나 브라우저/chromedriver가 죽은 경우에는 예외를 그대로 올려서
+    # _run_unit이 재시도(필요하면 브라우저 재시작)하도록 한다.
+    def _run_wait_script(self, script, timeout, *args):
+        if self._deadline is not None:
+            timeout = max(1, min(timeout, self._deadline.remaining()))
+        try:
+            self._driver.set_script_timeout(timeout + 5)
+            result = self._driver.execute_async_script(script, int(timeout * 1000), *args)
+        except (selenium_exceptions.JavascriptException, selenium_exceptions.TimeoutException) as e:
+            self._check_deadline()
+            print("[WAIT] script failed:", self._safe_ascii(str(e))[:200])
+            return None
+        except Exception:
+            self._check_deadline()
+            raise
+        self._check_deadline()
+        return result
+
+    def _wait_selector(self, css_list, timeout=20):
+        return self._run_wait_script(SELECTOR_READY_JS, timeout, list(css_list)) is not None
+
     def _collect_m3u8_requests(self, timeout=15):
         end = time.time() + timeout
         while time.time() < end:
+            self._check_deadline()
             reqs = [
                 r for r in self._driver.requests
                 if "https://vod.inflearn.com" in r.url and ".m3u8" in r.url
@@ -137,6 +1218,7 @@ class VideoCrawler:
         end = time.time() + timeout
         pending = set(key_paths)
         while time.time() < end and pending:
+            self._check_deadline()
             for r in self._driver.requests:
                 if "/key/" not in r.url or not r.response:
                     continue
@@ -151,6 +1233,7 @@ class VideoCrawler:
     def _find_key_request(self, key_path, timeout=15):
         end = time.time() + timeout
         while time.time() < end:
+            self._check_deadline()
             for r in self._driver.requests:
                 if "/key/" not in r.url or not r.response:
                     continue
@@ -201,7 +1284,7 @@ class VideoCrawler:
             print("[DEBUG] selector check failed:", e)
 
     def login(self):
-        loaded_keys = load_env_file()
+        loaded_keys = self._env_loaded | load_env_file()
         login_id = os.getenv("INFLEARN_EMAIL", "").strip()
         pw = os.getenv("INFLEARN_PASSWORD", "").strip()
         if not login_id or not pw:
@@ -260,6 +1343,19 @@ class VideoCrawler:
             raise
 
         
+    def _dest_root(self):
+        return os.getenv("INFLEARN_DEST_PATH", "").strip() or DEST_PATH
+
+    def _open_ledger(self):
+        ledger_path = os.getenv("INFLEARN_LEDGER", "").strip()
+        if not ledger_path:
+            raise RuntimeError("INFLEARN_LEDGER is required for coordinator/worker mode")
+        return WorkLedger(
+            ledger_path,
+            lease_seconds=env_int("INFLEARN_LEASE_SECONDS", 600),
+            max_attempts=env_int("INFLEARN_MAX_ATTEMPTS", 3),
+        )
+
     def get_video_from_current_page(self):
         return self.get_video_from_url(self._driver.current_url)
 
@@ -268,12 +1364,187 @@ class VideoCrawler:
 
     # start, end는 시작과 끝 지점의 인덱스
     def get_all_video_from_lecture(self, url, start=0, end=4321):
+        units = self._select_units(url, start, end)
+        if units is None:
+            return None
+        size = len(units)
+        max_attempts = env_int("INFLEARN_MAX_ATTEMPTS", 3)
+        pending = deque((idx, unit_url, 1) for idx, unit_url in units)
+        failed = []
+        while pending:
+            idx, unit_url, attempt = pending.popleft()
+            print(f'전체 강의 다운로드 {size} 중 {idx + 1}...')
+            ok, retry = self._run_unit(unit_url)
+            if retry and attempt < max_attempts:
+                # 시간 초과된 unit은 뒤로 보내고 나머지를 먼저 받는다.
+                print(f"나중에 다시 시도합니다. ({attempt}/{max_attempts})")
+                pending.append((idx, unit_url, attempt + 1))
+            elif ok is False:
+                print("현재 강의에서 실패했습니다. 다음 강의로 넘어갑니다.")
+                failed.append(idx + 1)
+
+        if failed:
+            print('실패한 강의:', failed)
+        print('강좌 다운로드가 모두 완료되었습니다.')
+
+    # 다운로드하지 않고 강좌의 unit별 크기, 재생시간, 예상 소요 시간을 표로 보여준다.
+    def plan_current_lecture(self, start=0, end=4321):
+        units = self._select_units(self._driver.current_url, start, end)
+        if units is None:
+            return None
+        mbps = env_int("INFLEARN_BANDWIDTH_MBPS", 50)
+        bytes_per_sec = max(1, mbps) * 1000 * 1000 / 8
+        rows = []
+        for idx, unit_url in units:
+            print(f'계획 작성 중 {len(units)} 중 {idx + 1}...')
+
+            def plan(url):
+                self._debug.begin_unit(unit_id_from_url(url))
+                row = None
+                try:
+                    with self._unit_budget():
+                        row = self._plan_unit(idx, url)
+                finally:
+                    self._debug.end_unit(row is not None)
+                return row
+
+            # 시간 초과든 WebDriver 오류든 _run_unit이 브라우저를 점검하고 필요하면 재시작한다.
+            row, _ = self._run_unit(unit_url, plan)
+            rows.append(row or (idx, unit_url, 0.0, 0, "error", False))
+
+        print()
+        print(f"{'#':>4}  {'duration':>9}  {'size':>9}  {'ETA':>9}  {'source':<9}  {'on disk':<7}  title")
+        total_dur = 0.0
+        total_bytes = 0
+        todo_bytes = 0
+        for idx, title, dur, size, source, on_disk in rows:
+            total_dur += dur
+            total_bytes += size
+            if not on_disk:
+                todo_bytes += size
+            print(f"{idx + 1:>4}  {format_duration(dur):>9}  {format_bytes(size):>9}  "
+                  f"{format_duration(size / bytes_per_sec):>9}  {source:<9}  {'yes' if on_disk else 'no':<7}  {title}")
+        print(f"total: {len(rows)} units, {format_duration(total_dur)}, {format_bytes(total_bytes)}")
+        print(f"to download: {format_bytes(todo_bytes)}, ETA {format_duration(todo_bytes / bytes_per_sec)} at {mbps} Mbps")
+        return rows
+
+    def _plan_unit(self, idx, unit_url):
+        with self._stage("page", env_int("INFLEARN_PAGE_TIMEOUT", 120)):
+            page = self._open_unit(unit_url)
+        if not page:
+            return None
+        dest_dir = os.path.join(self._dest_root(), page.lecture_title)
+        on_disk = os.path.isfile(os.path.join(dest_dir, page.course_filename)) or \
+            os.path.isfile(os.path.join(dest_dir, page.raw_filename))
+        title = os.path.splitext(page.raw_filename)[0]
+        with self._stage("playlist", env_int("INFLEARN_PLAYLIST_TIMEOUT", 180)):
+            stream = self._resolve_stream(page)
+        if stream is None:
+            # --from/--to 구간이 이 강의 밖인 경우
+            return (idx, title, 0.0, 0, "skipped", on_disk)
+        if not stream:
+            return (idx, title, 0.0, 0, "error", on_disk)
+        items = stream.items
+        media = [seg for seg in items if not seg.init]
+        duration = sum(seg.duration for seg in media) or stream.duration
+        if items and all(seg.byterange for seg in items):
+            return (idx, title, duration, sum(seg.byterange[1] for seg in items), "byterange", on_disk)
+        if stream.bandwidth and duration:
+            return (idx, title, duration, int(stream.bandwidth / 8 * duration), "bandwidth", on_disk)
+        # BANDWIDTH가 없으면 일부 세그먼트 크기를 동시에 조회해서 초당 바이트로 환산한다.
+        sample_count = max(1, env_int("INFLEARN_PLAN_SAMPLES", 5))
+        step = max(1, len(media) // sample_count)
+        sample = media[::step][:sample_count]
+        urls = []
+        for seg in sample:
+            seg_url = seg.uri if seg.uri.startswith("http") else (stream.root_url + seg.uri)
+            if stream.signed_query and "?" not in seg.uri:
+                seg_url += stream.signed_query
+            urls.append(seg_url)
+        with ThreadPoolExecutor(max_workers=len(urls) or 1, thread_name_prefix="probe") as pool:
+            sizes = list(pool.map(lambda u: self._probe_size(stream.session, stream.headers, u), urls))
+        probed = [(size, seg.duration) for size, seg in zip(sizes, sample) if size]
+        if not probed:
+            return (idx, title, duration, 0, "unknown", on_disk)
+        probed_bytes = sum(size for size, _ in probed)
+        probed_dur = sum(dur for _, dur in probed)
+        if probed_dur and duration:
+            estimate = int(probed_bytes / probed_dur * duration)
+        else:
+            estimate = int(probed_bytes / len(probed) * len(media))
+        return (idx, title, duration, estimate, "probe", on_disk)
+
+    def _probe_size(self, session, headers, url):
+        try:
+            resp = session.head(url, headers=headers, allow_redirects=True, timeout=15)
+            length = int(resp.headers.get("Content-Length") or 0)
+            if resp.status_code == 200 and length:
+                return length
+            # HEAD를 막아둔 경우 1바이트만 받아 Content-Range의 전체 크기를 본다.
+            resp = session.get(url, headers={**headers, "Range": "bytes=0-0"}, timeout=15, stream=True)
+            m = re.search(r"/(\d+)$", resp.headers.get("Content-Range", ""))
+            resp.close()
+            if m:
+                return int(m.group(1))
+        except Exception:
+            pass
+        return 0
+
+    # 공유 작업 목록에 현재 강좌의 unit들을 등록한다.
+    def enqueue_current_lecture(self, start=0, end=4321):
+        units = self._select_units(self._driver.current_url, start, end)
+        if units is None:
+            return None
+        ledger = self._open_ledger()
+        added = ledger.add_units(units)
+        print(f"[LEDGER] {added} units added ({len(units) - added} already queued)")
+        print("[LEDGER]", ledger.counts())
+        return added
+
+    # 공유 작업 목록에서 unit을 하나씩 가져와 scratch에 받고 공유 저장소로 옮긴다.
+    def run_worker(self):
+        ledger = self._open_ledger()
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._scratch_path = make_dest_path(
+            os.getenv("INFLEARN_SCRATCH_PATH", "").strip() or os.path.join(tempfile.gettempdir(), "inflearn_scratch")
+        )
+        poll = env_int("INFLEARN_POLL_SECONDS", 30)
+        print(f"[LEDGER] worker {worker} started")
+        while True:
+            try:
+                claimed = ledger.claim(worker)
+                counts = ledger.counts() if claimed is None else None
+            except sqlite3.OperationalError as e:
+                # 공유 볼륨이 바쁘면 database is locked 등이 날 수 있다. 잠시 후 다시 시도한다.
+                print("[LEDGER] ledger unavailable, retrying:", e)
+                time.sleep(poll)
+                continue
+            if claimed is None:
+                if not counts.get("pending") and not counts.get("leased"):
+                    break
+                # 다른 작업자가 잡고 있는 unit의 lease가 끝나기를 기다린다.
+                time.sleep(poll)
+                continue
+            idx, unit_url = claimed
+            print(f"[LEDGER] {worker} claimed {idx + 1}: {unit_url}")
+            with ledger.keep_alive(unit_url, worker):
+                ok, _ = self._run_unit(unit_url)
+            try:
+                state = ledger.complete(unit_url, worker, ok is not False)
+            except sqlite3.OperationalError as e:
+                # 기록하지 못한 unit은 lease가 만료되면 다시 배정된다.
+                print("[LEDGER] could not record result:", e)
+                continue
+            print(f"[LEDGER] {idx + 1}: {state}")
+        print("[LEDGER]", ledger.counts())
+        print('강좌 다운로드가 모두 완료되었습니다.')
+
+    def _select_units(self, url, start=0, end=4321):
         if self._driver.current_url != url:
             self._driver.get(url)
 
-        try:
-            self._wait_any(["a.unit_item", "li[data-unit-id]"], timeout=20)
-        except TimeoutException:
+        unit_selectors = ["a.unit_item", "li[data-unit-id]"]
+        if not self._wait_selector(unit_selectors, timeout=20):
             try:
                 tab = self._wait_any([
                     "button[title='커리큘럼']",
@@ -281,7 +1552,7 @@ class VideoCrawler:
                     "button[title='Curriculum']",
                 ], timeout=5)
                 tab.click()
-                time.sleep(1)
+                self._wait_selector(unit_selectors, timeout=10)
             except Exception:
                 pass
 
@@ -328,7 +1599,6 @@ class VideoCrawler:
             raise ValueError('start value never greater than end')
         if end >= len(unit_urls):
             end = len(unit_urls) - 1
-        size = end - start + 1
 
         env_unit_id = os.getenv("INFLEARN_UNIT_ID", "").strip()
         if env_unit_id:
@@ -340,57 +1610,132 @@ class VideoCrawler:
             start = 0
             end = 0
 
-        for idx, unit_url in enumerate(unit_urls):
-            if start > idx or idx > end:
-                continue
-            print(f'전체 강의 다운로드 {size} 중 {idx + 1}...')
-            ok = self.get_video_from_url(unit_url)
-            if ok is False:
-                print("중단: 현재 강의에서 실패했습니다.")
-                break
-
-        print('강좌 다운로드가 모두 완료되었습니다.')
+        return [(idx, unit_url) for idx, unit_url in enumerate(unit_urls) if start <= idx <= end]
 
     def get_video_from_url(self, url):
-        # requests 목록 초기화
-        del self._driver.requests
-
-        if self._driver.current_url != url:
-            print('connecting to url...', url)
-            self._driver.get(url)
-
+        self._debug.begin_unit(unit_id_from_url(url))
+        ok = False
         try:
-            self._wait.until(lambda d: d.find_element(By.TAG_NAME, 'video'))
-        except Exception:
-            print('동영상이 없는 페이지입니다.')
-            return False
+            with self._unit_budget():
+                ok = self._download_unit(url)
+        finally:
+            # 실패한 강의만 모아둔 재생목록을 디버그 폴더에 남긴다.
+            self._debug.end_unit(ok is not False)
+        return ok
 
-        print('영상 대기 중...', end='\r')
-        elapsed = 0
-        while True:
-            vid_js = None
+    def _download_unit(self, url):
+        with self._stage("page", env_int("INFLEARN_PAGE_TIMEOUT", 120)):
+            page = self._open_unit(url)
+        if not page:
+            return page
+        unit_id, lecture_title, course_title, raw_filename, course_filename = page[:5]
+        print(f'[{lecture_title} - {course_title}] 강좌를 다운로드합니다.')
+        # 파일이 이미 존재한다면 기본적으로 새로 생성하지 않는다.
+        force = os.getenv("INFLEARN_FORCE", "").strip() == "1"
+        dest_root = self._dest_root()
+        if os.path.isfile(os.path.join(dest_root, lecture_title, course_filename)) or \
+           os.path.isfile(os.path.join(dest_root, lecture_title, raw_filename)):
+            print(os.path.join(dest_root, lecture_title, course_filename))
+            if not force:
+                print('이미 존재하는 강의입니다. 다운로드하지 않습니다.')
+                # 영상은 두고 빠진 자막만 받는다.
+                self._fetch_missing_subtitles(page)
+                return None
             try:
-                vid_js = self._driver.find_element(By.CSS_SELECTOR, '.video-js')
+                os.remove(os.path.join(dest_root, lecture_title, course_filename))
             except Exception:
                 pass
-            if vid_js and 'vjs-playing' in vid_js.get_attribute('class'):
-                break
             try:
-                video_el = self._driver.find_element(By.TAG_NAME, 'video')
-                if video_el.get_attribute("src"):
-                    break
+                os.remove(os.path.join(dest_root, lecture_title, raw_filename))
             except Exception:
                 pass
-            time.sleep(0.5)
-            elapsed += 0.5
-            if elapsed > 10:
+
+        with self._stage("playlist", env_int("INFLEARN_PLAYLIST_TIMEOUT", 180)):
+            stream = self._resolve_stream(page)
+        if not stream:
+            return stream
+        session, headers, root_url, signed_query, items, total_segments, bandwidth, duration = stream[:8]
+
+        # 다운로드 받을 장소.
+        src_path = make_dest_path(os.path.join(self._scratch_path or dest_root, lecture_title))
+        raw_path = os.path.join(src_path, raw_filename)
+        expected_size = 0
+        if bandwidth and duration and total_segments:
+            expected_size = int(bandwidth / 8 * duration * len(items) / total_segments)
+            if not has_free_space(src_path, expected_size):
+                print(f"디스크 공간이 부족합니다. (예상 {expected_size} bytes)")
+                return False
+        # 자막은 영상 세그먼트를 받는 동안 같은 세션(커넥션 풀)으로 함께 받는다.
+        subtitle_pool, subtitle_jobs = self._start_subtitles(stream, unit_id)
+        writer = SegmentFileWriter(raw_path, expected_size)
+        ok = False
+        try:
+            # 전체 시간 대신 세그먼트가 기록될 때마다 갱신되는 멈춤 제한 시간을 건다.
+            with self._stage("download", env_int("INFLEARN_STALL_TIMEOUT", 120)):
+                ok = self._download_segments(items, session, headers, root_url, signed_query, writer)
+        finally:
+            if not ok:
+                writer.abort()
+            if subtitle_pool:
+                subtitle_pool.shutdown(wait=False)
+        if not ok:
+            return False
+        total_bytes = writer.finish()
+        subtitle_paths = self._save_subtitles(subtitle_jobs, src_path, os.path.splitext(raw_filename)[0],
+                                              stream.clip_window)
+        print('영상 다운로드 완료.')
+        print(f'  segments: {writer.segments}, bytes: {total_bytes}')
+        print('파일 저장 완료.', lecture_title, '-', course_title)
+        final_path = raw_path
+        remux = os.getenv("INFLEARN_REMUX", "").strip() == "1"
+        if remux:
+            ffmpeg = shutil.which("ffmpeg")
+            if not ffmpeg:
+                print("ffmpeg? ?? mp4? ??? ? ????. (INFLEARN_REMUX=1)")
+                print("  saved:", raw_path)
+            else:
+                out_path = os.path.join(src_path, course_filename)
+                cmd = [ffmpeg, "-y", "-i", raw_path, "-c", "copy", out_path]
+                remux_timeout = self._step_timeout(env_int("INFLEARN_REMUX_TIMEOUT", 900))
                 try:
-                    self._driver.find_element(By.XPATH, "//button[contains(@class, 'vjs-paused')]").click()
+                    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                   timeout=remux_timeout)
+                    os.remove(raw_path)
+                    final_path = out_path
+                    print("mp4 ?? ??:", out_path)
+                except subprocess.TimeoutExpired:
+                    # 변환이 멈추면 받은 .ts를 그대로 둔다.
+                    print(f"mp4 변환 시간 초과 ({remux_timeout:.0f}s), .ts 파일을 유지합니다.")
+                    try:
+                        os.remove(out_path)
+                    except OSError:
+                        pass
                 except Exception as e:
-                    print(e)
-            if elapsed > 30:
-                print('대기 시간이 너무 오래 걸립니다...')
-                return False
+                    print("mp4 ?? ??:", e)
+        if self._scratch_path:
+            self._publish(final_path, lecture_title)
+            for path in subtitle_paths:
+                self._publish(path, lecture_title)
+        return True
+
+    def _open_unit(self, url):
+        unit_id = unit_id_from_url(url)
+        # requests 목록 초기화
+        del self._driver.requests
+
+        if self._driver.current_url != url:
+            print('connecting to url...', url)
+            self._driver.get(url)
+
+        print('영상 대기 중...', end='\r')
+        ready_timeout = env_int("INFLEARN_READY_TIMEOUT", 30)
+        state = self._run_wait_script(PLAYER_READY_JS, ready_timeout, 10000)
+        if state == 'no_video':
+            print('동영상이 없는 페이지입니다.')
+            return False
+        if state in (None, 'timeout'):
+            print('대기 시간이 너무 오래 걸립니다...')
+            return False
         print('영상 로드 완료', end='\r')
         # 만약 영상이 재생 중이라면 멈추게 하기.
         try:
@@ -435,33 +1780,29 @@ class VideoCrawler:
         lead = lecture_title.split(".", 1)[0].strip()
         if lead.isdigit():
             course_index = int(lead)
-        raw_filename = f'{course_index} - {course_title}.ts'
-        course_filename = f'{course_index} - {course_title}.mp4'
-        print(f'[{lecture_title} - {course_title}] 강좌를 다운로드합니다.')
-        # 파일이 이미 존재한다면 기본적으로 새로 생성하지 않는다.
-        force = os.getenv("INFLEARN_FORCE", "").strip() == "1"
-        if os.path.isfile(os.path.join(DEST_PATH, lecture_title, course_filename)) or \
-           os.path.isfile(os.path.join(DEST_PATH, lecture_title, raw_filename)):
-            print(os.path.join(DEST_PATH, lecture_title, course_filename))
-            if not force:
-                print('이미 존재하는 강의입니다. 다운로드하지 않습니다.')
-                return None
-            try:
-                os.remove(os.path.join(DEST_PATH, lecture_title, course_filename))
-            except Exception:
-                pass
-            try:
-                os.remove(os.path.join(DEST_PATH, lecture_title, raw_filename))
-            except Exception:
-                pass
+        clip_start, clip_end = self._clip_range
+        base_filename = f'{course_index} - {course_title}'
+        if clip_start is not None or clip_end is not None:
+            base_filename += f' [{format_clip_label(clip_start, clip_end)}]'
+        raw_filename = f'{base_filename}.ts'
+        course_filename = f'{base_filename}.mp4'
+        return UnitPage(unit_id, lecture_title, course_title, raw_filename, course_filename, clip_start, clip_end)
 
+    # 캡처한 요청에서 재생목록을 찾아 받을 세그먼트 목록까지 정한다.
+    def _resolve_stream(self, page):
+        unit_id = page.unit_id
+        clip_start, clip_end = page.clip_start, page.clip_end
         headers = {}
         session = requests.Session()
         root_url = None
         meta_info_url = None
+        meta_resp = None
         sources = None
         segments = None
         signed_query = ""
+        bandwidth = 0
+        duration = 0.0
+        subtitle_uris = {}
         m3u8_reqs = self._collect_m3u8_requests(timeout=15)
         if not m3u8_reqs:
             try:
@@ -469,6 +1810,10 @@ class VideoCrawler:
             except Exception:
                 pass
             m3u8_reqs = self._collect_m3u8_requests(timeout=15)
+        for r in m3u8_reqs:
+            m = re.search(r"/([a-z]{2})\.m3u8$", urlsplit(r.url).path)
+            if m and m.group(1) in SUBTITLE_LANGS:
+                subtitle_uris.setdefault(m.group(1), r.url)
         preferred = None
         for r in m3u8_reqs:
             if "/encrypted/master.m3u8" in r.url:
@@ -523,52 +1868,31 @@ class VideoCrawler:
             session.headers.update(headers)
             if cookie_jar:
                 session.cookies.update(cookie_jar)
-            resp = session.get(url=request.url, headers=headers)
-            try:
-                os.makedirs("debug", exist_ok=True)
-                master_path = os.path.join("debug", f"master_{time.strftime('%Y%m%d_%H%M%S')}.m3u8")
-                with open(master_path, "wb") as f:
-                    f.write(resp.content)
+            resp = self._playlists.fetch(session, request.url, headers, unit_id, timeout=self._http_timeout())
+            master_path = self._debug.add_playlist("master.m3u8", resp.content)
+            if master_path:
                 print("  [M3U8] saved:", master_path)
-            except Exception:
-                pass
             if b"skd://" in resp.content or b"METHOD=SAMPLE" in resp.content:
                 print("DRM 감지: 현재 스트림은 지원하지 않습니다.")
                 return False
             lines = [line for line in resp.content.splitlines() if line]
             if lines:
                 # If this is already a media playlist, use it directly.
-                if any(b".ts" in line for line in lines):
-                    current_key_uri = None
-                    current_iv = None
-                    tmp_segments = []
-                    print(f"  [M3U8] selected duration: {self._m3u8_duration(resp.content):.1f}s")
-                    for line in lines:
-                        if line.startswith(b"#EXT-X-KEY:"):
-                            text = line.decode("utf-8", "ignore")
-                            m = re.search(r'URI="([^"]+)"', text)
-                            current_key_uri = m.group(1) if m else None
-                            m = re.search(r'IV=0x([0-9a-fA-F]+)', text)
-                            current_iv = bytes.fromhex(m.group(1)) if m else None
-                            continue
-                        if line.startswith(b"#"):
-                            continue
-                        if line.startswith(b"http"):
-                            seg = line.decode("utf-8", "ignore")
-                        else:
-                            decoded = line.decode("utf-8", "ignore")
-                            if decoded and decoded.isascii():
-                                seg = decoded
-                            else:
-                                seg = quote_from_bytes(line)
-                        tmp_segments.append((seg, current_key_uri, current_iv))
-                    segments = tmp_segments
+                if any(b".ts" in line or line.startswith(b"#EXTINF") for line in lines):
+                    duration = self._m3u8_duration(resp.content)
+                    print(f"  [M3U8] selected duration: {duration:.1f}s")
+                    segments = resp.segments if resp.segments is not None else parse_media_playlist(resp.content)
                 else:
+                    subtitle_uris.update(parse_subtitle_renditions(resp.content))
                     stream_lines = []
+                    stream_bandwidth = {}
                     last_was_stream = False
+                    last_bandwidth = 0
                     for line in lines:
                         if line.startswith(b"#EXT-X-STREAM-INF"):
                             last_was_stream = True
+                            m = re.search(rb"AVERAGE-BANDWIDTH=(\d+)", line) or re.search(rb"[:,]BANDWIDTH=(\d+)", line)
+                            last_bandwidth = int(m.group(1)) if m else 0
                             continue
                         if line.startswith(b"#"):
                             continue
@@ -577,10 +1901,12 @@ class VideoCrawler:
                                 last_was_stream = False
                                 continue
                             stream_lines.append(line)
+                            stream_bandwidth[line] = last_bandwidth
                         last_was_stream = False
                     if stream_lines:
                         best_line = None
                         best_dur = -1.0
+                        best_resp = None
                         for line in stream_lines:
                             if line.startswith(b"http"):
                                 candidate = line.decode("utf-8", "ignore")
@@ -594,26 +1920,30 @@ class VideoCrawler:
                             if signed_query and "?" not in candidate:
                                 cand_url += signed_query
                             try:
-                                cand_resp = session.get(url=cand_url, headers=headers)
+                                cand_resp = self._playlists.fetch(session, cand_url, headers, unit_id,
+                                                                  timeout=self._http_timeout())
                                 if cand_resp.status_code != 200:
                                     continue
                                 dur = self._m3u8_duration(cand_resp.content)
                                 if dur > best_dur:
                                     best_dur = dur
                                     best_line = candidate
+                                    best_resp = cand_resp
+                                    bandwidth = stream_bandwidth.get(line, 0)
                             except Exception:
                                 continue
                         if best_line:
                             print(f"  [M3U8] selected duration: {best_dur:.1f}s")
                             meta_info_url = best_line
+                            meta_resp = best_resp
+                            duration = best_dur
         if root_url is None:
             try:
-                os.makedirs("debug", exist_ok=True)
-                req_path = os.path.join("debug", f"requests_{time.strftime('%Y%m%d_%H%M%S')}.txt")
-                with open(req_path, "w", encoding="utf-8") as f:
-                    for r in list(self._driver.requests)[-200:]:
-                        f.write(f"{r.url}\n")
-                print("  saved requests:", req_path)
+                req_path = self._debug.save(
+                    "requests.txt", "".join(f"{r.url}\n" for r in list(self._driver.requests)[-200:])
+                )
+                if req_path:
+                    print("  saved requests:", req_path)
             except Exception:
                 pass
             print('root url을 찾을 수 없습니다.')
@@ -626,47 +1956,33 @@ class VideoCrawler:
             meta_url = root_url + meta_info_url
             if signed_query and "?" not in meta_info_url:
                 meta_url += signed_query
-            resp = session.get(url=meta_url, headers=headers)
-            try:
-                os.makedirs("debug", exist_ok=True)
-                meta_path = os.path.join("debug", f"meta_{time.strftime('%Y%m%d_%H%M%S')}.m3u8")
-                with open(meta_path, "wb") as f:
-                    f.write(resp.content)
+            # 변형 선택 때 받아둔 재생목록을 그대로 쓴다.
+            resp = meta_resp or self._playlists.fetch(session, meta_url, headers, unit_id,
+                                                      timeout=self._http_timeout())
+            meta_path = self._debug.add_playlist("meta.m3u8", resp.content)
+            if meta_path:
                 print("  [M3U8] saved:", meta_path)
-            except Exception:
-                pass
             if resp.status_code != 200:
-                print(resp.text)
+                print(resp.content.decode("utf-8", "ignore"))
                 return False
             if b"skd://" in resp.content or b"METHOD=SAMPLE" in resp.content:
                 print("DRM 감지: 현재 스트림은 지원하지 않습니다.")
                 return False
             # get source url list
-            current_key_uri = None
-            current_iv = None
-            tmp_segments = []
-            for line in resp.content.splitlines():
-                if not line:
-                    continue
-                if line.startswith(b"#EXT-X-KEY:"):
-                    text = line.decode("utf-8", "ignore")
-                    m = re.search(r'URI="([^"]+)"', text)
-                    current_key_uri = m.group(1) if m else None
-                    m = re.search(r'IV=0x([0-9a-fA-F]+)', text)
-                    current_iv = bytes.fromhex(m.group(1)) if m else None
-                    continue
-                if line.startswith(b"#"):
-                    continue
-                if line.startswith(b"http"):
-                    seg = line.decode("utf-8", "ignore")
-                else:
-                    decoded = line.decode("utf-8", "ignore")
-                    if decoded and decoded.isascii():
-                        seg = decoded
-                    else:
-                        seg = quote_from_bytes(line)
-                tmp_segments.append((seg, current_key_uri, current_iv))
-            segments = tmp_segments
+            segments = resp.segments if resp.segments is not None else parse_media_playlist(resp.content)
+        total_segments = len(segments) if segments is not None else len(sources or [])
+        clip_window = None
+        if segments is not None and (clip_start is not None or clip_end is not None):
+            total_duration = sum(seg.duration for seg in segments)
+            segments, clip_offset = clip_segments(segments, clip_start, clip_end)
+            if not segments:
+                print(f"  [CLIP] {format_clip_label(clip_start, clip_end)} is outside this lecture "
+                      f"({total_duration:.1f}s). 건너뜁니다.")
+                return None
+            clip_duration = sum(seg.duration for seg in segments)
+            clip_window = (clip_offset, clip_offset + clip_duration)
+            print(f"  [CLIP] {format_clip_label(clip_start, clip_end)}: {len(segments)}/{total_segments} segments,"
+                  f" {clip_offset:.1f}s ~ {clip_offset + clip_duration:.1f}s")
         max_segments_env = os.getenv("INFLEARN_MAX_SEGMENTS", "").strip()
         if max_segments_env.isdigit():
             max_segments = max(1, int(max_segments_env))
@@ -674,26 +1990,225 @@ class VideoCrawler:
                 segments = segments[:max_segments]
             elif sources is not None:
                 sources = sources[:max_segments]
-        videos = []
-        fail_shown = 0
-        key_cache = {}
-        key_token_cache = {}
         if segments is not None:
             items = segments
         else:
-            items = [(s, None, None) for s in (sources or [])]
+            items = [Segment(s, None, None, n) for n, s in enumerate(sources or [])]
+        return UnitStream(session, headers, root_url, signed_query, items, total_segments,
+                          bandwidth, duration, subtitle_uris, clip_window)
+
+    # scratch에 받은 파일을 공유 저장소로 옮긴다. 복사가 끝난 뒤에 이름을 바꿔서 반쯤 쓴 파일이 보이지 않게 한다.
+    def _publish(self, path, lecture_title):
+        dest_dir = make_dest_path(os.path.join(self._dest_root(), lecture_title))
+        dest = os.path.join(dest_dir, os.path.basename(path))
+        tmp = dest + ".part"
+        # 공유 볼륨이 느려도 진행이 있는 동안은 계속하고, 멈추면 취소할 수 있도록 조각 단위로 복사한다.
+        with self._stage("publish", env_int("INFLEARN_STALL_TIMEOUT", 120)):
+            try:
+                with open(path, "rb") as src, open(tmp, "wb") as out:
+                    while True:
+                        chunk = src.read(COPY_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                        self._check_deadline()
+                        self._touch_deadline()
+            except BaseException:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                raise
+        os.replace(tmp, dest)
+        os.remove(path)
+        print("  published:", dest)
+        return dest
+
+    def _fetch_subtitle(self, session, headers, url, signed_query, unit_id):
+        resp = self._playlists.fetch(session, url, headers, unit_id, timeout=self._http_timeout())
+        if resp.status_code != 200:
+            print(f"\n  [SUB] playlist {resp.status_code}: {self._safe_ascii(url)}")
+            return None
+        # URI가 재생목록이 아니라 .vtt 파일 하나인 경우
+        if resp.content.lstrip(b"\xef\xbb\xbf").startswith(b"WEBVTT"):
+            return merge_webvtt([resp.content])
+        if b"#EXT-X-STREAM-INF" in resp.content or b"#EXT-X-KEY" in resp.content:
+            print(f"\n  [SUB] not a subtitle playlist: {self._safe_ascii(url)}")
+            return None
+        base_url = url.split("?", 1)[0]
+        base_url = base_url[:base_url.rfind('/') + 1]
+        segments = resp.segments if resp.segments is not None else parse_media_playlist(resp.content)
+        bodies = []
+        for seg in segments:
+            seg_url = seg.uri if seg.uri.startswith("http") else (base_url + seg.uri)
+            if signed_query and "?" not in seg.uri:
+                seg_url += signed_query
+            seg_resp = session.get(url=seg_url, headers=headers, timeout=self._http_timeout())
+            if seg_resp.status_code != 200:
+                continue
+            # 첫 조각이 WebVTT가 아니면 영상 재생목록으로 보고 나머지를 받지 않는다.
+            if not bodies and not seg_resp.content.lstrip(b"\xef\xbb\xbf").startswith(b"WEBVTT"):
+                print(f"\n  [SUB] not WebVTT, skipped: {self._safe_ascii(seg_url)}")
+                return None
+            bodies.append(seg_resp.content)
+        return merge_webvtt(bodies)
+
+    # INFLEARN_SUBTITLES의 언어 목록과 저장 형식.
+    def _subtitle_settings(self):
+        wanted = [lang.strip().lower() for lang in os.getenv("INFLEARN_SUBTITLES", "").split(",") if lang.strip()]
+        fmt = "srt" if os.getenv("INFLEARN_SUBTITLE_FORMAT", "").strip().lower() == "srt" else "vtt"
+        return wanted, fmt
+
+    # 지정한 자막 rendition을 별도 스레드에서 받기 시작한다. 반환값은 (pool, {언어: future}).
+    # skip_dir가 있으면 그 폴더에 이미 <base>.<lang>.<fmt>가 있는 언어는 받지 않는다.
+    def _start_subtitles(self, stream, unit_id, base_name=None, skip_dir=None):
+        wanted, fmt = self._subtitle_settings()
+        if not wanted:
+            return None, {}
+        selected = {
+            lang: uri for lang, uri in stream.subtitle_uris.items() if "all" in wanted or lang in wanted
+        }
+        if not selected:
+            print(f"  [SUB] no subtitles for {wanted} (available: {sorted(stream.subtitle_uris)})")
+            return None, {}
+        if skip_dir:
+            selected = {
+                lang: uri for lang, uri in selected.items()
+                if not os.path.isfile(os.path.join(skip_dir, f"{base_name}.{lang}.{fmt}"))
+            }
+            if not selected:
+                return None, {}
+        pool = ThreadPoolExecutor(max_workers=len(selected), thread_name_prefix="subtitle")
+        jobs = {}
+        for lang, uri in selected.items():
+            sub_url = uri if uri.startswith("http") else (stream.root_url + uri)
+            if stream.signed_query and "?" not in uri:
+                sub_url += stream.signed_query
+            jobs[lang] = pool.submit(
+                self._fetch_subtitle, stream.session, stream.headers, sub_url, stream.signed_query, unit_id
+            )
+        return pool, jobs
+
+    # 이미 받은 영상에 대해 빠진 자막만 받는다. (INFLEARN_FORCE로 영상을 다시 받지 않아도 되도록)
+    def _fetch_missing_subtitles(self, page):
+        wanted, fmt = self._subtitle_settings()
+        if not wanted:
+            return
+        dest_dir = os.path.join(self._dest_root(), page.lecture_title)
+        base_name = os.path.splitext(page.raw_filename)[0]
+        # 언어를 직접 지정했고 모두 있으면 재생목록도 열지 않는다.
+        if "all" not in wanted and all(
+            os.path.isfile(os.path.join(dest_dir, f"{base_name}.{lang}.{fmt}")) for lang in wanted
+        ):
+            return
+        with self._stage("playlist", env_int("INFLEARN_PLAYLIST_TIMEOUT", 180)):
+            stream = self._resolve_stream(page)
+        if not stream:
+            return
+        pool, jobs = self._start_subtitles(stream, page.unit_id, base_name, dest_dir)
+        if not jobs:
+            return
+        src_path = make_dest_path(os.path.join(self._scratch_path or self._dest_root(), page.lecture_title))
+        try:
+            paths = self._save_subtitles(jobs, src_path, base_name, stream.clip_window)
+        finally:
+            pool.shutdown(wait=False)
+        if self._scratch_path:
+            for path in paths:
+                self._publish(path, page.lecture_title)
+
+    # clip_window가 있으면 잘라낸 영상과 맞도록 cue를 거르고 시각을 옮긴다.
+    def _save_subtitles(self, jobs, src_path, base_name, clip_window=None):
+        _, fmt = self._subtitle_settings()
+        paths = []
+        # 자막이 늦으면 영상은 그대로 두고 그 언어만 건너뛴다. (다음 실행에서 빠진 자막만 다시 받는다.)
+        wait_until = time.monotonic() + env_int("INFLEARN_SUBTITLE_TIMEOUT", 120)
+        for lang, future in jobs.items():
+            timeout = self._step_timeout(max(1.0, wait_until - time.monotonic()))
+            try:
+                cues = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                print(f"  [SUB] {lang} timed out")
+                continue
+            except (Exception, UnitTimeout) as e:
+                print(f"  [SUB] {lang} failed: {self._safe_ascii(str(e))[:200]}")
+                continue
+            if cues and clip_window:
+                cues = clip_cues(cues, *clip_window)
+            if not cues:
+                print(f"  [SUB] {lang}: no cues")
+                continue
+            path = os.path.join(src_path, f"{base_name}.{lang}.{fmt}")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(format_subtitles(cues, fmt))
+            print(f"  [SUB] saved: {path} ({len(cues)} cues)")
+            paths.append(path)
+        return paths
+
+    # 본문을 조각 단위로 받으면서 조각마다 취소 여부를 확인하고 멈춤 제한 시간을 갱신한다.
+    # 느린 링크에서도 바이트가 들어오는 동안은 끊기지 않고, 취소되면 다음 조각에서 바로 빠져나온다.
+    def _get_streamed(self, session, url, headers):
+        resp = session.get(url=url, headers=headers, timeout=self._http_timeout(), stream=True)
+        try:
+            chunks = []
+            for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                chunks.append(chunk)
+                self._check_deadline()
+                self._touch_deadline()
+            content = b"".join(chunks)
+        finally:
+            resp.close()
+        text = "" if resp.status_code in (200, 206) else content[:1000].decode("utf-8", "replace")
+        return RangePart(resp.status_code, content, text)
+
+    # full_bodies: Range를 무시하고 전체 파일을 준 리소스의 본문. 같은 리소스의 나머지 구간은 여기서 잘라 쓴다.
+    def _fetch_segment_group(self, session, headers, seg_url, items, group, full_bodies):
+        first = items[group[0]]
+        if first.byterange is None:
+            return {group[0]: self._get_streamed(session, seg_url, headers)}
+        start = first.byterange[0]
+        last = items[group[-1]].byterange
+        end = last[0] + last[1] - 1
+        if first.uri in full_bodies:
+            body = full_bodies[first.uri]
+            base = 0
+        else:
+            resp = self._get_streamed(session, seg_url, {**headers, "Range": f"bytes={start}-{end}"})
+            if resp.status_code == 206:
+                base = start
+            elif resp.status_code == 200:
+                # Range를 무시하고 전체 파일을 준 경우
+                base = 0
+                full_bodies[first.uri] = resp.content
+                print(f"\n  [RANGE] server ignored Range, reusing full body: {self._safe_ascii(seg_url)}")
+            else:
+                return {idx: resp for idx in group}
+            body = resp.content
+        # 이 리소스의 구간이 더 남아있지 않으면 보관한 본문을 놓아준다.
+        if first.uri in full_bodies and not any(seg.uri == first.uri for seg in items[group[-1] + 1:]):
+            del full_bodies[first.uri]
+        parts = {}
+        for idx in group:
+            offset, length = items[idx].byterange
+            chunk = body[offset - base:offset - base + length]
+            if len(chunk) != length:
+                parts[idx] = RangePart(206, b"", f"short range {len(chunk)}/{length} bytes={offset}-{offset + length - 1}")
+            else:
+                parts[idx] = RangePart(200, chunk, "")
+        return parts
+
+    def _download_segments(self, items, session, headers, root_url, signed_query, writer):
+        fail_shown = 0
+        key_cache = {}
+        key_token_cache = {}
         key_paths = []
-        for _, key_uri, _ in items:
-            if not key_uri:
+        for seg in items:
+            if not seg.key_uri:
                 continue
-            path = urlsplit(key_uri).path
+            path = urlsplit(seg.key_uri).path
             if path and path not in key_paths:
                 key_paths.append(path)
-        try:
-            self._driver.execute_script("var v=document.querySelector('video'); if (v) { v.muted=true; v.play(); }")
-            time.sleep(2)
-        except Exception:
-            pass
+        self._run_wait_script(VIDEO_PLAYING_JS, 5)
         try:
             self._driver.execute_script(
                 "var v=document.querySelector('video'); if (v) { v.currentTime=0; v.playbackRate=4.0; v.muted=true; v.play(); }"
@@ -702,7 +2217,17 @@ class VideoCrawler:
             pass
         key_cache.update(self._prefetch_keys(key_paths, timeout=10))
         last_key_log = None
-        for idx, (src, key_uri, iv) in enumerate(items):
+        groups = coalesce_ranges(items, env_int("INFLEARN_RANGE_COALESCE_MB", 8) * 1024 * 1024)
+        group_of = {group[0]: group for group in groups}
+        if len(groups) < len(items):
+            print(f"  [RANGE] {len(items)} segments in {len(groups)} requests")
+        fetched = {}
+        full_bodies = {}
+        for idx, seg in enumerate(items):
+            src, key_uri, iv = seg.uri, seg.key_uri, seg.iv
+            # IV 없는 초기화 구간(EXT-X-MAP)은 암호화되지 않은 것으로 본다.
+            if seg.init and iv is None:
+                key_uri = None
             print(f'영상 다운로드 중... ({idx / len(items) * 100:<4.1f}%)', end='\r')
             if src.startswith("http"):
                 seg_url = src
@@ -710,7 +2235,10 @@ class VideoCrawler:
                 seg_url = root_url + src
             if signed_query and "?" not in src:
                 seg_url += signed_query
-            resp = session.get(url=seg_url, headers=headers)
+            if idx in group_of:
+                fetched.update(self._fetch_segment_group(session, headers, seg_url, items, group_of[idx],
+                                                         full_bodies))
+            resp = fetched.pop(idx)
             if resp.status_code == 200:
                 content = resp.content
                 if key_uri:
@@ -766,7 +2294,8 @@ class VideoCrawler:
                                 if not candidate or candidate in tried:
                                     continue
                                 tried.append(candidate)
-                                key_resp = session.get(url=candidate, headers=key_headers)
+                                key_resp = session.get(url=candidate, headers=key_headers,
+                                                       timeout=self._http_timeout())
                                 if key_resp.status_code == 200 and key_resp.content:
                                     key = key_resp.content
                                     key_url = candidate
@@ -789,26 +2318,24 @@ class VideoCrawler:
                                     print(f"[KEY FAIL] body={self._safe_ascii(resp_preview)}")
                                 print(f"[KEY FAIL] segment={idx} seg_url={self._safe_ascii(seg_url)}")
                                 try:
-                                    os.makedirs("debug", exist_ok=True)
-                                    ts = time.strftime("%Y%m%d_%H%M%S")
-                                    dbg_path = os.path.join("debug", f"key_fail_{ts}.txt")
-                                    with open(dbg_path, "w", encoding="utf-8") as f:
-                                        f.write(f"key_url={key_url_raw}\n")
-                                        if key_url_signed:
-                                            f.write(f"key_url_signed={key_url_signed}\n")
-                                        f.write(f"segment={idx}\n")
-                                        f.write(f"seg_url={seg_url}\n")
-                                        f.write("cookies:\n")
-                                        try:
-                                            for c in self._driver.get_cookies():
-                                                f.write(f"  {c.get('name')}={c.get('value')}\n")
-                                        except Exception:
-                                            pass
-                                        f.write("recent key requests:\n")
-                                        for r in list(self._driver.requests)[-200:]:
-                                            if "/key/" in r.url:
-                                                f.write(f"  {r.url} status={getattr(r.response, 'status_code', None)}\n")
-                                    print(f"[KEY FAIL] saved debug: {dbg_path}")
+                                    lines = [f"key_url={key_url_raw}\n"]
+                                    if key_url_signed:
+                                        lines.append(f"key_url_signed={key_url_signed}\n")
+                                    lines.append(f"segment={idx}\n")
+                                    lines.append(f"seg_url={seg_url}\n")
+                                    lines.append("cookies:\n")
+                                    try:
+                                        for c in self._driver.get_cookies():
+                                            lines.append(f"  {c.get('name')}={c.get('value')}\n")
+                                    except Exception:
+                                        pass
+                                    lines.append("recent key requests:\n")
+                                    for r in list(self._driver.requests)[-200:]:
+                                        if "/key/" in r.url:
+                                            lines.append(f"  {r.url} status={getattr(r.response, 'status_code', None)}\n")
+                                    dbg_path = self._debug.save("key_fail.txt", "".join(lines))
+                                    if dbg_path:
+                                        print(f"[KEY FAIL] saved debug: {dbg_path}")
                                 except Exception:
                                     pass
                                 return False
@@ -824,7 +2351,7 @@ class VideoCrawler:
                         print(f"[KEY FAIL] segment={idx} seg_url={self._safe_ascii(seg_url)}")
                         return False
                     if iv is None:
-                        iv = idx.to_bytes(16, "big")
+                        iv = seg.sequence.to_bytes(16, "big")
                     if len(iv) != 16:
                         print("[KEY FAIL] invalid IV length")
                         print(f"[KEY FAIL] segment={idx} seg_url={self._safe_ascii(seg_url)}")
@@ -836,48 +2363,52 @@ class VideoCrawler:
                         print(f"[DECRYPT FAIL] url={self._safe_ascii(key_url)}")
                         print(f"[DECRYPT FAIL] segment={idx} seg_url={self._safe_ascii(seg_url)}")
                         return False
-                videos.append(content)
-            elif fail_shown < 3:
-                fail_shown += 1
-                preview = resp.text[:200] if resp.text else ""
-                safe_url = seg_url.encode("ascii", "backslashreplace").decode("ascii")
-                print(f"\n  [SEGMENT FAIL] {resp.status_code} {safe_url}")
-                if preview:
-                    safe_preview = preview.encode("ascii", "backslashreplace").decode("ascii")
-                    print(f"  [SEGMENT BODY] {safe_preview}")
-        total_bytes = sum(len(v) for v in videos)
-        print('영상 다운로드 완료. 파일로 다운로드합니다.')
-        print(f'  segments: {len(videos)}, bytes: {total_bytes}')
-
-        # 다운로드 받을 장소.
-        src_path = os.path.join(DEST_PATH, lecture_title)
-        if not os.path.isdir(src_path):
-            os.mkdir(src_path)
-        raw_path = os.path.join(src_path, raw_filename)
-        with open(raw_path, 'wb') as f:
-            for idx, vid in enumerate(videos):
-                print(f'??? ???????.. ({idx / len(videos) * 100:<4.1f}%)', end='\r')
-                f.write(vid)
-            print('?????? ???.', lecture_title, '-', course_title)
-            videos.clear()
-        remux = os.getenv("INFLEARN_REMUX", "").strip() == "1"
-        if remux:
-            ffmpeg = shutil.which("ffmpeg")
-            if not ffmpeg:
-                print("ffmpeg? ?? mp4? ??? ? ????. (INFLEARN_REMUX=1)")
-                print("  saved:", raw_path)
-                return True
-            out_path = os.path.join(src_path, course_filename)
-            cmd = [ffmpeg, "-y", "-i", raw_path, "-c", "copy", out_path]
-            try:
-                subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                os.remove(raw_path)
-                print("mp4 ?? ??:", out_path)
-            except Exception as e:
-                print("mp4 ?? ??:", e)
+                if not writer.expected_size and not seg.init:
+                    # 재생목록에 BANDWIDTH가 없으면 첫 미디어 세그먼트 크기로 전체 크기를 추정한다.
+                    # (EXT-X-MAP 초기화 구간은 작아서 추정에 쓰지 않는다.)
+                    estimate = len(content) * sum(1 for item in items if not item.init)
+                    if not has_free_space(os.path.dirname(writer.path), estimate):
+                        print(f"디스크 공간이 부족합니다. (예상 {estimate} bytes)")
+                        return False
+                    writer.reserve(estimate)
+                writer.write(content)
+                self._touch_deadline()
+            else:
+                self._touch_deadline()
+                if fail_shown < 3:
+                    fail_shown += 1
+                    preview = resp.text[:200] if resp.text else ""
+                    safe_url = seg_url.encode("ascii", "backslashreplace").decode("ascii")
+                    print(f"\n  [SEGMENT FAIL] {resp.status_code} {safe_url}")
+                    if preview:
+                        safe_preview = preview.encode("ascii", "backslashreplace").decode("ascii")
+                        print(f"  [SEGMENT BODY] {safe_preview}")
         return True
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--from", dest="clip_from", type=parse_timestamp,
+                        help="start time, e.g. 12:30 (INFLEARN_FROM)")
+    parser.add_argument("--to", dest="clip_to", type=parse_timestamp,
+                        help="end time, e.g. 25:00 (INFLEARN_TO)")
+    parser.add_argument("--plan", action="store_true", help="only estimate size and duration (INFLEARN_PLAN=1)")
+    args = parser.parse_args()
+    if args.plan:
+        os.environ["INFLEARN_PLAN"] = "1"
+    if args.clip_from is not None and args.clip_to is not None and args.clip_from >= args.clip_to:
+        parser.error("--from must be earlier than --to")
+    if args.clip_from is not None:
+        os.environ["INFLEARN_FROM"] = str(args.clip_from)
+    if args.clip_to is not None:
+        os.environ["INFLEARN_TO"] = str(args.clip_to)
     vc = VideoCrawler()
     vc.login()
-    vc.get_videos_from_current_lecture()
+    role = os.getenv("INFLEARN_ROLE", "").strip().lower()
+    if os.getenv("INFLEARN_PLAN", "").strip() == "1":
+        vc.plan_current_lecture()
+    elif role == "coordinator":
+        vc.enqueue_current_lecture()
+    elif role == "worker":
+        vc.run_worker()
+    else:
+        vc.get_videos_from_current_lecture()